@@ -1,48 +1,138 @@
 import asyncio
-import logging
+import collections
+import functools
 import json
-from typing import Dict, Any
+import logging
+import sys
+import time
+import types
+from typing import Dict, Any, Awaitable, Callable, Mapping
 
-from pymongo import AsyncMongoClient
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 from flexus_client_kit import ckit_client
 from flexus_client_kit import ckit_cloudtool
 from flexus_client_kit import ckit_bot_exec
 from flexus_client_kit import ckit_shutdown
-from flexus_client_kit import ckit_ask_model
-from flexus_client_kit import ckit_mongo
-from flexus_client_kit import ckit_kanban
-from flexus_client_kit.integrations import fi_mongo_store
-from flexus_client_kit.integrations import fi_pdoc
-from flexus_client_kit.integrations import fi_google_analytics
-from flexus_client_kit.integrations import fi_question
 from metricmaster import metricmaster_install
-from metricmaster.tools import fi_google_tag_manager
-from metricmaster.tools import fi_google_analytics_enhanced
 
 logger = logging.getLogger("bot_metricmaster")
 
 BOT_NAME = "metricmaster"
 BOT_VERSION = "0.1.0"
 
-TOOLS = [
-    fi_google_analytics.GOOGLE_ANALYTICS_TOOL,
-    fi_google_analytics_enhanced.GOOGLE_ANALYTICS_ENHANCED_TOOL,
-    fi_google_tag_manager.GOOGLE_TAG_MANAGER_TOOL,
-    fi_mongo_store.MONGO_STORE_TOOL,
-    fi_pdoc.POLICY_DOCUMENT_TOOL,
-    fi_question.ASK_QUESTIONS_TOOL,
-]
+GA_CACHE_TTL = 300.0
+GA_CACHE_MAX_ENTRIES = 256
+
+
+@functools.lru_cache(maxsize=1)
+def get_tools() -> tuple[ckit_cloudtool.CloudTool, ...]:
+    # Integrations pull in google api clients and pymongo, import them only when tools are actually needed
+    from flexus_client_kit.integrations import fi_mongo_store
+    from flexus_client_kit.integrations import fi_pdoc
+    from flexus_client_kit.integrations import fi_google_analytics
+    from flexus_client_kit.integrations import fi_question
+    from metricmaster.tools import fi_google_tag_manager
+    from metricmaster.tools import fi_google_analytics_enhanced
+    return (
+        fi_google_analytics.GOOGLE_ANALYTICS_TOOL,
+        fi_google_analytics_enhanced.GOOGLE_ANALYTICS_ENHANCED_TOOL,
+        fi_google_tag_manager.GOOGLE_TAG_MANAGER_TOOL,
+        fi_mongo_store.MONGO_STORE_TOOL,
+        fi_pdoc.POLICY_DOCUMENT_TOOL,
+        fi_question.ASK_QUESTIONS_TOOL,
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def get_tools_by_name() -> Mapping[str, ckit_cloudtool.CloudTool]:
+    return types.MappingProxyType({t.name: t for t in get_tools()})
+
+
+def __getattr__(name: str):
+    if name == "TOOLS":
+        return get_tools()
+    if name == "TOOLS_BY_NAME":
+        return get_tools_by_name()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _is_cacheable_ga_call(op: str, args: Any) -> bool:
+    # Only read-style ops, status depends on auth state and must always be live. Same rule as
+    # google_analytics_enhanced's own result cache: ranges ending today are still filling up
+    if not (op.startswith(("get", "list")) or op == "customQuery"):
+        return False
+    date_range = str(args.get("dateRange", "")) if isinstance(args, dict) else ""
+    return "today" not in date_range and "realtime" not in date_range
+
+
+def _ga_cache_key(tool_name: str, model_produced_args: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return tool_name.encode() + b":" + orjson.dumps(model_produced_args, option=orjson.OPT_SORT_KEYS)
+    return (tool_name + ":" + json.dumps(model_produced_args, sort_keys=True, default=str)).encode()
+
+
+def _cached_ga_handler(
+    cache: collections.OrderedDict,
+    tool_name: str,
+    handler: Callable[[ckit_cloudtool.FCloudtoolCall, Dict[str, Any]], Awaitable[str]],
+):
+    async def toolcall_cached(toolcall: ckit_cloudtool.FCloudtoolCall, model_produced_args: Dict[str, Any]) -> str:
+        if not model_produced_args:
+            return await handler(toolcall, model_produced_args)
+        op = model_produced_args.get("op", "")
+        if not isinstance(op, str) or not _is_cacheable_ga_call(op, model_produced_args.get("args")):
+            return await handler(toolcall, model_produced_args)
+
+        key = _ga_cache_key(tool_name, model_produced_args)
+        now = time.monotonic()
+        hit = cache.get(key)
+        if hit is not None and now - hit[0] < GA_CACHE_TTL:
+            cache.move_to_end(key)
+            return hit[1]
+
+        result = await handler(toolcall, model_produced_args)
+        if isinstance(result, str) and not result.startswith("❌"):
+            cache[key] = (now, result)
+            cache.move_to_end(key)
+            while len(cache) > GA_CACHE_MAX_ENTRIES:
+                cache.popitem(last=False)
+        return result
+
+    return toolcall_cached
 
 
 async def metricmaster_main_loop(fclient: ckit_client.FlexusClient, rcx: ckit_bot_exec.RobotContext) -> None:
+    from pymongo import AsyncMongoClient
+    from flexus_client_kit import ckit_mongo
+    from flexus_client_kit.integrations import fi_mongo_store
+    from flexus_client_kit.integrations import fi_pdoc
+    from flexus_client_kit.integrations import fi_google_analytics
+    from flexus_client_kit.integrations import fi_question
+    from metricmaster.tools import fi_google_tag_manager
+    from metricmaster.tools import fi_google_analytics_enhanced
+
     setup = ckit_bot_exec.official_setup_mixing_procedure(
         metricmaster_install.METRICMASTER_SETUP_SCHEMA,
         rcx.persona.persona_setup,
     )
 
     mongo_conn_str = await ckit_mongo.mongo_fetch_creds(fclient, rcx.persona.persona_id)
-    mongo = AsyncMongoClient(mongo_conn_str)
+    mongo = AsyncMongoClient(
+        mongo_conn_str,
+        maxPoolSize=20,
+        minPoolSize=2,
+        maxIdleTimeMS=60000,
+        serverSelectionTimeoutMS=5000,
+    )
     dbname = rcx.persona.persona_id + "_db"
     mydb = mongo[dbname]
     personal_mongo = mydb["personal_mongo"]
@@ -52,53 +142,36 @@ async def metricmaster_main_loop(fclient: ckit_client.FlexusClient, rcx: ckit_bo
     ga_enhanced_integration = fi_google_analytics_enhanced.IntegrationGoogleAnalyticsEnhanced(
         fclient, rcx, ga_integration,
     )
-    gtm_integration = fi_google_tag_manager.IntegrationGoogleTagManager(fclient, rcx)
+    gtm_integration = fi_google_tag_manager.IntegrationGoogleTagManager(fclient, rcx, setup)
 
     logger.info("MetricMaster bot initialized for persona %s", rcx.persona.persona_id)
 
-    @rcx.on_updated_message
-    async def updated_message_in_db(msg: ckit_ask_model.FThreadMessageOutput):
-        pass
-
-    @rcx.on_updated_thread
-    async def updated_thread_in_db(th: ckit_ask_model.FThreadOutput):
-        pass
-
-    @rcx.on_updated_task
-    async def updated_task_in_db(t: ckit_kanban.FPersonaKanbanTaskOutput):
-        pass
-
-    @rcx.on_tool_call(fi_google_analytics.GOOGLE_ANALYTICS_TOOL.name)
-    async def toolcall_google_analytics(toolcall: ckit_cloudtool.FCloudtoolCall, model_produced_args: Dict[str, Any]) -> str:
-        return await ga_integration.called_by_model(toolcall, model_produced_args)
-
-    @rcx.on_tool_call(fi_google_analytics_enhanced.GOOGLE_ANALYTICS_ENHANCED_TOOL.name)
-    async def toolcall_google_analytics_enhanced(toolcall: ckit_cloudtool.FCloudtoolCall, model_produced_args: Dict[str, Any]) -> str:
-        return await ga_enhanced_integration.called_by_model(toolcall, model_produced_args)
-
-    @rcx.on_tool_call(fi_google_tag_manager.GOOGLE_TAG_MANAGER_TOOL.name)
-    async def toolcall_google_tag_manager(toolcall: ckit_cloudtool.FCloudtoolCall, model_produced_args: Dict[str, Any]) -> str:
-        return await gtm_integration.called_by_model(toolcall, model_produced_args)
-
-    @rcx.on_tool_call(fi_mongo_store.MONGO_STORE_TOOL.name)
-    async def toolcall_mongo_store(toolcall: ckit_cloudtool.FCloudtoolCall, model_produced_args: Dict[str, Any]) -> str:
-        return await fi_mongo_store.handle_mongo_store(
-            rcx.workdir,
-            personal_mongo,
-            toolcall,
-            model_produced_args,
-        )
-
-    @rcx.on_tool_call(fi_pdoc.POLICY_DOCUMENT_TOOL.name)
-    async def toolcall_pdoc(toolcall: ckit_cloudtool.FCloudtoolCall, model_produced_args: Dict[str, Any]) -> str:
-        return await pdoc_integration.called_by_model(toolcall, model_produced_args)
-
-    @rcx.on_tool_call(fi_question.ASK_QUESTIONS_TOOL.name)
     async def toolcall_ask_questions(toolcall: ckit_cloudtool.FCloudtoolCall, model_produced_args: Dict[str, Any]) -> str:
         return fi_question.handle_ask_questions(toolcall, model_produced_args)
 
+    ga_cache = collections.OrderedDict()
+    ga_name = fi_google_analytics.GOOGLE_ANALYTICS_TOOL.name
+    ga_enhanced_name = fi_google_analytics_enhanced.GOOGLE_ANALYTICS_ENHANCED_TOOL.name
+    gtm_name = fi_google_tag_manager.GOOGLE_TAG_MANAGER_TOOL.name
+    mongo_store_name = fi_mongo_store.MONGO_STORE_TOOL.name
+    pdoc_name = fi_pdoc.POLICY_DOCUMENT_TOOL.name
+    ask_questions_name = fi_question.ASK_QUESTIONS_TOOL.name
+
+    tool_handlers = {
+        ga_name: _cached_ga_handler(ga_cache, ga_name, ga_integration.called_by_model),
+        # google_analytics_enhanced has its own result cache honoring cacheTtl, don't stack another on top
+        ga_enhanced_name: ga_enhanced_integration.called_by_model,
+        gtm_name: gtm_integration.called_by_model,
+        mongo_store_name: functools.partial(fi_mongo_store.handle_mongo_store, rcx.workdir, personal_mongo),
+        pdoc_name: pdoc_integration.called_by_model,
+        ask_questions_name: toolcall_ask_questions,
+    }
+    for tool_name, handler in tool_handlers.items():
+        rcx.on_tool_call(tool_name)(handler)
+
+    shutdown_is_set = ckit_shutdown.shutdown_event.is_set
     try:
-        while not ckit_shutdown.shutdown_event.is_set():
+        while not shutdown_is_set():
             await rcx.unpark_collected_events(sleep_if_no_work=10.0)
 
     finally:
@@ -106,19 +179,32 @@ async def metricmaster_main_loop(fclient: ckit_client.FlexusClient, rcx: ckit_bo
         logger.info("MetricMaster bot %s exit", rcx.persona.persona_id)
 
 
+def _new_event_loop() -> asyncio.AbstractEventLoop:
+    # Set once for the whole bot group: tasks that finish without awaiting skip a trip through the loop
+    loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+    loop.set_task_factory(asyncio.eager_task_factory)
+    return loop
+
+
 def main():
     scenario_fn = ckit_bot_exec.parse_bot_args()
     fclient = ckit_client.FlexusClient(ckit_client.bot_service_name(BOT_NAME, BOT_VERSION), endpoint="/v1/jailed-bot")
 
-    asyncio.run(ckit_bot_exec.run_bots_in_this_group(
+    bots = ckit_bot_exec.run_bots_in_this_group(
         fclient,
         marketable_name=BOT_NAME,
         marketable_version_str=BOT_VERSION,
         bot_main_loop=metricmaster_main_loop,
-        inprocess_tools=TOOLS,
+        inprocess_tools=get_tools(),
         scenario_fn=scenario_fn,
         install_func=metricmaster_install.install,
-    ))
+    )
+    if sys.version_info >= (3, 12):  # eager_task_factory and asyncio.run(loop_factory=...)
+        asyncio.run(bots, loop_factory=_new_event_loop)
+    else:
+        if uvloop is not None:
+            uvloop.install()  # deprecated from 3.12 on, where the loop_factory above is used instead
+        asyncio.run(bots)
 
 
 if __name__ == "__main__":
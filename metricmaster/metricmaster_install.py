@@ -1,8 +1,16 @@
 import asyncio
 import base64
+import functools
 import json
+import logging
+import mmap
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from flexus_client_kit import ckit_client, ckit_bot_install
 from flexus_client_kit import ckit_cloudtool
 from flexus_simple_bots import prompts_common
@@ -10,6 +18,8 @@ from metricmaster import metricmaster_prompts
 from flexus_client_kit.integrations import fi_google_analytics
 from metricmaster.tools import fi_google_tag_manager
 
+logger = logging.getLogger("metricmaster_install")
+
 BOT_DESCRIPTION = """
 ## MetricMaster - Google Analytics 4 & Tag Manager Specialist
 
@@ -96,35 +106,110 @@ METRICMASTER_SETUP_SCHEMA = (
     ]
 )
 
+METRICMASTER_SETUP_SCHEMA_NAMES = frozenset(item["bs_name"] for item in METRICMASTER_SETUP_SCHEMA)
+
 METRICMASTER_DEFAULT_LARK = """
 print("MetricMaster processing %d messages" % len(messages))
 """
 
+_FEATURED_ACTIONS = [
+    {
+        "feat_question": "Help me set up Google Analytics 4 and Tag Manager",
+        "feat_expert": "default",
+        "feat_depends_on_setup": [],
+    },
+    {
+        "feat_question": "Show me my website traffic for the last 30 days",
+        "feat_expert": "default",
+        "feat_depends_on_setup": ["GA_DEFAULT_PROPERTY"],
+    },
+    {
+        "feat_question": "Set up event tracking for form submissions",
+        "feat_expert": "default",
+        "feat_depends_on_setup": ["GTM_DEFAULT_CONTAINER"],
+    },
+]
+
+_SCHEDULE = [
+    prompts_common.SCHED_TASK_SORT_10M | {"sched_when": "EVERY:10m"},
+    prompts_common.SCHED_TODO_5M | {
+        "sched_when": "EVERY:5m",
+        "sched_first_question": "Work on the assigned analytics task",
+        "sched_fexp_name": "scheduled",
+    },
+    {
+        "sched_type": "SCHED_ANY",
+        "sched_when": "WEEKDAYS:MO:FR/09:00",
+        "sched_first_question": "Check if there are any scheduled reports configured. If yes, generate them and save to policy documents.",
+        "sched_fexp_name": "scheduled",
+    },
+]
+
+
+def _encode_file_b64(path: Path) -> str:
+    if path.stat().st_size == 0:
+        return ""  # mmap refuses empty files
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return base64.b64encode(mm).decode("ascii")
 
-async def install(
-    client: ckit_client.FlexusClient,
-    ws_id: str,
-    bot_name: str,
-    bot_version: str,
-    tools: list[ckit_cloudtool.CloudTool],
-):
-    bot_internal_tools = json.dumps([t.openai_style_tool() for t in tools])
 
+@functools.lru_cache(maxsize=1)
+def _load_encoded_images() -> tuple[str, str]:
     pic_big_path = Path(__file__).with_name("metricmaster-1024x1536.webp")
     pic_small_path = Path(__file__).with_name("metricmaster-256x256.webp")
 
     if pic_big_path.exists():
-        pic_big = base64.b64encode(pic_big_path.read_bytes()).decode("ascii")
+        pic_big = _encode_file_b64(pic_big_path)
     else:
         pic_big = ""
         logger.warning("Big image not found at %s", pic_big_path)
 
     if pic_small_path.exists():
-        pic_small = base64.b64encode(pic_small_path.read_bytes()).decode("ascii")
+        pic_small = _encode_file_b64(pic_small_path)
     else:
         pic_small = ""
         logger.warning("Small image not found at %s", pic_small_path)
 
+    return pic_big, pic_small
+
+
+_TOOL_DESCRIPTOR_CACHE: dict[int, tuple[ckit_cloudtool.CloudTool, dict]] = {}
+_BOT_INTERNAL_TOOLS_CACHE: dict[tuple[int, ...], str] = {}
+
+
+def _tool_descriptor(tool: ckit_cloudtool.CloudTool) -> dict:
+    # Keep a reference to the tool so its id() can't be reused while cached
+    cached = _TOOL_DESCRIPTOR_CACHE.get(id(tool))
+    if cached is None:
+        cached = (tool, tool.openai_style_tool())
+        _TOOL_DESCRIPTOR_CACHE[id(tool)] = cached
+    return cached[1]
+
+
+def _tools_json(tools: tuple[ckit_cloudtool.CloudTool, ...]) -> str:
+    key = tuple(id(t) for t in tools)
+    cached = _BOT_INTERNAL_TOOLS_CACHE.get(key)
+    if cached is None:
+        descriptors = [_tool_descriptor(t) for t in tools]
+        if orjson is not None:
+            cached = orjson.dumps(descriptors).decode("utf-8")
+        else:
+            cached = json.dumps(descriptors)
+        _BOT_INTERNAL_TOOLS_CACHE[key] = cached
+    return cached
+
+
+async def install(
+    client: ckit_client.FlexusClient,
+    ws_id: str,
+    bot_name: str,
+    bot_version: str,
+    tools: tuple[ckit_cloudtool.CloudTool, ...],
+):
+    bot_internal_tools = _tools_json(tools)
+
+    pic_big, pic_small = await asyncio.to_thread(_load_encoded_images)
+
     await ckit_bot_install.marketplace_upsert_dev_bot(
         client,
         ws_id=ws_id,
@@ -140,23 +225,7 @@ async def install(
         marketable_github_repo="https://github.com/yourusername/metricmaster.git",
         marketable_run_this="python -m metricmaster.metricmaster_bot",
         marketable_setup_default=METRICMASTER_SETUP_SCHEMA,
-        marketable_featured_actions=[
-            {
-                "feat_question": "Help me set up Google Analytics 4 and Tag Manager",
-                "feat_expert": "default",
-                "feat_depends_on_setup": [],
-            },
-            {
-                "feat_question": "Show me my website traffic for the last 30 days",
-                "feat_expert": "default",
-                "feat_depends_on_setup": ["GA_DEFAULT_PROPERTY"],
-            },
-            {
-                "feat_question": "Set up event tracking for form submissions",
-                "feat_expert": "default",
-                "feat_depends_on_setup": ["GTM_DEFAULT_CONTAINER"],
-            },
-        ],
+        marketable_featured_actions=_FEATURED_ACTIONS,
         marketable_intro_message="Hello! I'm MetricMaster, your Google Analytics 4 and Tag Manager specialist. I can help you set up analytics, configure event tracking, and generate insights from your data. Let's get started!",
         marketable_preferred_model_default="grok-4-1-fast-reasoning",
         marketable_daily_budget_default=200_000,
@@ -182,29 +251,13 @@ async def install(
         marketable_tags=["Analytics", "Google Analytics", "Tag Manager", "Reports"],
         marketable_picture_big_b64=pic_big,
         marketable_picture_small_b64=pic_small,
-        marketable_schedule=[
-            prompts_common.SCHED_TASK_SORT_10M | {"sched_when": "EVERY:10m"},
-            prompts_common.SCHED_TODO_5M | {
-                "sched_when": "EVERY:5m",
-                "sched_first_question": "Work on the assigned analytics task",
-                "sched_fexp_name": "scheduled",
-            },
-            {
-                "sched_type": "SCHED_ANY",
-                "sched_when": "WEEKDAYS:MO:FR/09:00",
-                "sched_first_question": "Check if there are any scheduled reports configured. If yes, generate them and save to policy documents.",
-                "sched_fexp_name": "scheduled",
-            },
-        ],
+        marketable_schedule=_SCHEDULE,
         marketable_forms=ckit_bot_install.load_form_bundles(__file__),
     )
 
 
 if __name__ == "__main__":
-    import logging
-    logger = logging.getLogger("metricmaster_install")
-
     from metricmaster import metricmaster_bot
     args = ckit_bot_install.bot_install_argparse()
     client = ckit_client.FlexusClient("metricmaster_install")
-    asyncio.run(install(client, ws_id=args.ws, bot_name=metricmaster_bot.BOT_NAME, bot_version=metricmaster_bot.BOT_VERSION, tools=metricmaster_bot.TOOLS))
+    asyncio.run(install(client, ws_id=args.ws, bot_name=metricmaster_bot.BOT_NAME, bot_version=metricmaster_bot.BOT_VERSION, tools=metricmaster_bot.get_tools()))
@@ -1,3 +1,5 @@
+import sys
+
 from flexus_simple_bots import prompts_common
 
 PROMPT_GTM_SETUP = """
@@ -140,3 +142,6 @@ Use the same analytics tools as in main mode, but focus on automation and report
 {prompts_common.PROMPT_POLICY_DOCUMENTS}
 {prompts_common.PROMPT_HERE_GOES_SETUP}
 """
+
+main_prompt = sys.intern(main_prompt)
+scheduled_prompt = sys.intern(scheduled_prompt)
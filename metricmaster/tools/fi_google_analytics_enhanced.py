@@ -1,4 +1,13 @@
+import asyncio
+import collections
+import functools
+import gzip
+import hashlib
+import json
 import logging
+import random
+import re
+import time
 from typing import Dict, Any, Optional
 
 from flexus_client_kit.integrations import fi_google_analytics
@@ -100,6 +109,10 @@ google_analytics_enhanced(op="customQuery", args={
 })
     Execute a custom analytics query with filters.
 
+# Caching
+All report operations accept an optional "cacheTtl" (seconds, default 60, 0 disables).
+Identical queries within that window reuse the previous result.
+
 # Recommended Events for Different Industries:
 
 E-commerce:
@@ -120,8 +133,164 @@ SaaS:
 - upgrade, feature_usage, subscription_cancel
 """
 
+# Words and op names appearing in HELP, kept since HELP itself is only stored compressed
+HELP_TOKENS = frozenset(re.findall(r"\w+", HELP))
+
+# Help is rarely requested, keep only the compressed copy resident
+_HELP_GZ = gzip.compress(HELP.encode("utf-8"), compresslevel=9)
+del HELP
+
+
+def _help() -> str:
+    return gzip.decompress(_HELP_GZ).decode("utf-8")
+
+
+def __getattr__(name: str):
+    if name == "HELP":
+        return _help()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 GOOGLE_ANALYTICS_ENHANCED_SETUP_SCHEMA = []
 
+RESULT_CACHE_TTL = 60.0
+RESULT_CACHE_MAX_ENTRIES = 512
+
+_RESULT_CACHE: "collections.OrderedDict[str, tuple[float, str]]" = collections.OrderedDict()
+_PENDING: Dict[str, asyncio.Task] = {}
+
+PROPERTY_MAX_CONCURRENCY = 5
+_PROPERTY_SEMAPHORES: Dict[str, asyncio.Semaphore] = {}
+
+
+# GA4 event names are letters, digits and underscores
+_EVENT_NAME_RE = re.compile(r"\w+")
+
+REPORT_RETRIES = 4
+TRANSIENT_HTTP_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def _is_transient_error(e: BaseException) -> bool:
+    if isinstance(e, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(getattr(e, "resp", None), "status", None)  # googleapiclient.errors.HttpError
+    if status is None:
+        status = getattr(e, "code", None)  # google.api_core.exceptions
+    try:
+        return int(status) in TRANSIENT_HTTP_STATUSES
+    except (TypeError, ValueError):
+        return False
+
+
+def _report_event_names(report: str) -> set:
+    # Leading value of each row below the header, column names like "eventCount" are not events
+    lines = report.splitlines()
+    for i, line in enumerate(lines):
+        if "eventName" in _EVENT_NAME_RE.findall(line):
+            lines = lines[i + 1:]
+            break
+    names = set()
+    for line in lines:
+        m = _EVENT_NAME_RE.search(line)
+        if m is not None:
+            names.add(m.group())
+    return names
+
+
+def _pending_done(key: str, task: asyncio.Task) -> None:
+    if _PENDING.get(key) is task:
+        del _PENDING[key]
+    if not task.cancelled():
+        task.exception()  # waiters re-raise it, don't log "never retrieved" when all of them were cancelled
+
+
+def _property_semaphore(property_id: str) -> asyncio.Semaphore:
+    sem = _PROPERTY_SEMAPHORES.get(property_id)
+    if sem is None:
+        sem = asyncio.Semaphore(PROPERTY_MAX_CONCURRENCY)
+        _PROPERTY_SEMAPHORES[property_id] = sem
+    return sem
+
+
+_REQUIRED_ARGS = {
+    "getEventConfig": ("propertyId", "eventName"),
+    "listEvents": ("propertyId",),
+    "getEventReport": ("propertyId",),
+    "getConversions": ("propertyId",),
+    "getEcommerceReport": ("propertyId",),
+    "getUserJourney": ("propertyId",),
+    "getFunnelReport": ("propertyId", "funnelSteps"),
+    "customQuery": ("propertyId",),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _missing_args_error(missing: tuple) -> str:
+    quoted = [f"'{k}'" for k in missing]
+    if len(quoted) == 1:
+        return f"❌ Missing required parameter: {quoted[0]}"
+    return f"❌ Missing required parameters: {', '.join(quoted[:-1])} and {quoted[-1]}"
+
+
+def _as_tuple(value: Any) -> tuple:
+    if isinstance(value, str):
+        return (value,)
+    return tuple(value)
+
+
+# op: (default dateRange, default metrics, default dimensions, orderBy metric, limit, args the caller may override)
+_REPORT_TEMPLATES = {
+    "getEventConfig": ("last7days", ("eventCount",), ("eventName",), None, None, ()),
+    "listEvents": ("last7days", ("eventCount", "eventValue"), ("eventName",), "eventCount", 50, ("dateRange",)),
+    "getEventReport": ("last30days", ("eventCount", "eventValue"), ("date", "eventName"), "eventCount", None, ("dateRange", "metrics", "dimensions")),
+    "getConversions": ("last30days", ("conversions", "totalRevenue", "sessions"), ("sessionSource", "sessionMedium"), "conversions", 20, ("dateRange", "dimensions")),
+    "getEcommerceReport": ("last30days", ("itemRevenue", "itemsPurchased", "itemsViewed"), ("itemName", "itemCategory"), "itemRevenue", 30, ("dateRange", "dimensions")),
+    "getUserJourney": ("last7days", ("screenPageViews", "sessions"), ("pagePath", "pageTitle"), "screenPageViews", 100, ("dateRange",)),
+    # Every funnel step needs the same pagePath breakdown, so one report covers the whole funnel
+    "getFunnelReport": ("last30days", ("screenPageViews", "sessions"), ("pagePath",), "screenPageViews", 100, ("dateRange",)),
+}
+
+GA4_MAX_METRICS = 10
+GA4_MAX_DIMENSIONS = 9
+
+_CUSTOM_QUERY_DEFAULTS = (
+    ("dateRange", "last30days"),
+    ("metrics", ("sessions",)),
+    ("dimensions", ()),
+    ("orderBy", None),
+    ("limit", 100),
+)
+
+
+def _template_args(op: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    date_range, metrics, dimensions, order_by_metric, limit, overridable = _REPORT_TEMPLATES[op]
+    base_args = {
+        "propertyId": args.get("propertyId", ""),
+        "dateRange": args.get("dateRange", date_range) if "dateRange" in overridable else date_range,
+        "metrics": args.get("metrics", list(metrics)) if "metrics" in overridable else list(metrics),
+        "dimensions": args.get("dimensions", list(dimensions)) if "dimensions" in overridable else list(dimensions),
+    }
+    if order_by_metric:
+        base_args["orderBy"] = {"metric": order_by_metric, "desc": True}
+    if limit is not None:
+        base_args["limit"] = limit
+    return base_args
+
+
+def _cache_ttl(args: Dict[str, Any]) -> float:
+    # Only a cache hint, a null or malformed value must not fail the report
+    ttl = args.get("cacheTtl")
+    if ttl is None:
+        return RESULT_CACHE_TTL
+    try:
+        return max(float(ttl), 0.0)
+    except (TypeError, ValueError):
+        return RESULT_CACHE_TTL
+
+
+def _cache_key(scope: str, base_args: Dict[str, Any]) -> str:
+    blob = scope + "\n" + json.dumps(base_args, sort_keys=True, default=str)
+    return hashlib.blake2b(blob.encode(), digest_size=16).hexdigest()
+
 
 class IntegrationGoogleAnalyticsEnhanced:
 
@@ -134,6 +303,14 @@ class IntegrationGoogleAnalyticsEnhanced:
         self.fclient = fclient
         self.rcx = rcx
         self.base = base_integration
+        # Ops that are just a templated report get a generated handler, the rest post-process the result
+        self._ops = {op: functools.partial(self._template_report, op) for op in _REPORT_TEMPLATES}
+        self._ops.update({
+            "getEventConfig": self._get_event_config,
+            "getUserJourney": self._get_user_journey,
+            "getFunnelReport": self._get_funnel_report,
+            "customQuery": self._custom_query,
+        })
 
     async def called_by_model(
         self,
@@ -141,19 +318,14 @@ class IntegrationGoogleAnalyticsEnhanced:
         model_produced_args: Optional[Dict[str, Any]]
     ) -> str:
         if not model_produced_args:
-            return HELP
+            return _help()
 
         op = model_produced_args.get("op", "")
-        args, args_error = ckit_cloudtool.sanitize_args(model_produced_args)
-        if args_error:
-            return args_error
-
         print_help = not op or "help" in op
         print_status = not op or "status" in op
 
-        authenticated = await self.base._ensure_services()
-
         if print_status:
+            authenticated = await self.base._ensure_services()
             r = f"Google Analytics Enhanced integration status:\n"
             r += f"  Authenticated: {'✅ Yes' if authenticated else '❌ No'}\n"
             r += f"  User: {self.rcx.persona.owner_fuser_id}\n"
@@ -161,194 +333,161 @@ class IntegrationGoogleAnalyticsEnhanced:
                 return await self.base.called_by_model(toolcall, model_produced_args)
             return r
 
+        # Neither help nor status look at args or need a token
         if print_help:
-            return HELP
+            return _help()
 
+        args, args_error = ckit_cloudtool.sanitize_args(model_produced_args)
+        if args_error:
+            return args_error
+
+        authenticated = await self.base._ensure_services()
         if not authenticated:
             return await self.base.called_by_model(toolcall, model_produced_args)
 
         try:
-            if op == "getEventConfig":
-                return await self._get_event_config(args)
-            elif op == "listEvents":
-                return await self._list_events(args)
-            elif op == "getEventReport":
-                return await self._get_event_report(args)
-            elif op == "getConversions":
-                return await self._get_conversions(args)
-            elif op == "getEcommerceReport":
-                return await self._get_ecommerce_report(args)
-            elif op == "getUserJourney":
-                return await self._get_user_journey(args)
-            elif op == "getFunnelReport":
-                return await self._get_funnel_report(args)
-            elif op == "customQuery":
-                return await self._custom_query(args)
-            else:
+            handler = self._ops.get(op)
+            if handler is None:
                 return f"❌ Unknown operation: {op}\n\nTry google_analytics_enhanced(op='help') for usage."
+            missing = tuple(k for k in _REQUIRED_ARGS.get(op, ()) if not args.get(k))
+            if missing:
+                return _missing_args_error(missing)
+            return await handler(args)
 
         except Exception as e:
             logger.exception("Error in enhanced analytics")
             return f"❌ Error: {str(e)}"
 
+    async def _cached_report(self, base_args: Dict[str, Any], ttl: float = RESULT_CACHE_TTL) -> str:
+        date_range = str(base_args.get("dateRange", ""))
+        cacheable = ttl > 0 and "today" not in date_range and "realtime" not in date_range
+
+        # Scope by workspace and user, results depend on whose Google account is authorized.
+        # Relative ranges like "last7days" resolve per day, the UTC date keeps the key stable within a day.
+        day = time.strftime("%Y-%m-%d", time.gmtime())
+        key = _cache_key(f"{self.rcx.persona.ws_id}/{self.rcx.persona.owner_fuser_id}/{day}", base_args)
+        now = time.monotonic()
+        if cacheable:
+            hit = _RESULT_CACHE.get(key)
+            if hit is not None and now - hit[0] < ttl:
+                _RESULT_CACHE.move_to_end(key)
+                return hit[1]
+
+        # Identical request already in flight: wait for it instead of asking GA again. The report runs in
+        # its own task, a caller that gets cancelled stops waiting without cancelling it for the others
+        task = _PENDING.get(key)
+        if task is None:
+            task = asyncio.create_task(self._run_and_cache_report(key, base_args, cacheable, now))
+            _PENDING[key] = task
+            task.add_done_callback(functools.partial(_pending_done, key))
+        return await asyncio.shield(task)
+
+    async def _run_and_cache_report(self, key: str, base_args: Dict[str, Any], cacheable: bool, now: float) -> str:
+        result = await self._run_report(base_args)
+        if cacheable and isinstance(result, str) and not result.startswith("❌"):
+            _RESULT_CACHE[key] = (now, result)
+            _RESULT_CACHE.move_to_end(key)
+            while len(_RESULT_CACHE) > RESULT_CACHE_MAX_ENTRIES:
+                _RESULT_CACHE.popitem(last=False)
+        return result
+
+    async def _run_report(self, base_args: Dict[str, Any], retries: int = REPORT_RETRIES) -> str:
+        # GA4 limits concurrent requests per property, queue here instead of hitting rateLimitExceeded
+        sem = _property_semaphore(str(base_args.get("propertyId", "")))
+        for attempt in range(retries - 1):
+            try:
+                async with sem:
+                    return await self.base._get_report(base_args)
+            except Exception as e:
+                if not _is_transient_error(e):
+                    raise
+                delay = min(2 ** attempt * 0.25, 4.0) + random.random() * 0.1
+                logger.info("Transient GA error %r, retry %d/%d in %.2fs", e, attempt + 1, retries - 1, delay)
+            await asyncio.sleep(delay)
+        async with sem:
+            return await self.base._get_report(base_args)
+
     async def _get_event_config(self, args: Dict[str, Any]) -> str:
-        property_id = args.get("propertyId", "")
         event_name = args.get("eventName", "")
 
-        if not property_id or not event_name:
-            return "❌ Missing required parameters: 'propertyId' and 'eventName'"
-
-        base_args = {
-            "propertyId": property_id,
-            "dateRange": "last7days",
-            "metrics": ["eventCount"],
-            "dimensions": ["eventName"],
-        }
+        base_args = _template_args("getEventConfig", args)
 
-        result = await self.base._get_report(base_args)
+        result = await self._cached_report(base_args, _cache_ttl(args))
 
-        if event_name in result:
+        # Match whole event names, "purchase" must not match a "purchase_refund" row
+        if event_name in _report_event_names(result):
             return f"✅ Event '{event_name}' is being tracked.\n\n{result}"
         else:
             return f"⚠️ Event '{event_name}' not found in recent data. It may not be tracked yet or has no data in the last 7 days."
 
-    async def _list_events(self, args: Dict[str, Any]) -> str:
-        property_id = args.get("propertyId", "")
-        date_range = args.get("dateRange", "last7days")
-
-        if not property_id:
-            return "❌ Missing required parameter: 'propertyId'"
-
-        base_args = {
-            "propertyId": property_id,
-            "dateRange": date_range,
-            "metrics": ["eventCount", "eventValue"],
-            "dimensions": ["eventName"],
-            "orderBy": {"metric": "eventCount", "desc": True},
-            "limit": 50,
-        }
-
-        return await self.base._get_report(base_args)
-
-    async def _get_event_report(self, args: Dict[str, Any]) -> str:
-        property_id = args.get("propertyId", "")
-        event_name = args.get("eventName", "")
-
-        if not property_id:
-            return "❌ Missing required parameter: 'propertyId'"
-
-        base_args = {
-            "propertyId": property_id,
-            "dateRange": args.get("dateRange", "last30days"),
-            "metrics": args.get("metrics", ["eventCount", "eventValue"]),
-            "dimensions": args.get("dimensions", ["date", "eventName"]),
-            "orderBy": {"metric": "eventCount", "desc": True},
-        }
-
-        return await self.base._get_report(base_args)
-
-    async def _get_conversions(self, args: Dict[str, Any]) -> str:
-        property_id = args.get("propertyId", "")
-
-        if not property_id:
-            return "❌ Missing required parameter: 'propertyId'"
-
-        base_args = {
-            "propertyId": property_id,
-            "dateRange": args.get("dateRange", "last30days"),
-            "metrics": ["conversions", "totalRevenue", "sessions"],
-            "dimensions": args.get("dimensions", ["sessionSource", "sessionMedium"]),
-            "orderBy": {"metric": "conversions", "desc": True},
-            "limit": 20,
-        }
-
-        return await self.base._get_report(base_args)
-
-    async def _get_ecommerce_report(self, args: Dict[str, Any]) -> str:
-        property_id = args.get("propertyId", "")
-
-        if not property_id:
-            return "❌ Missing required parameter: 'propertyId'"
-
-        base_args = {
-            "propertyId": property_id,
-            "dateRange": args.get("dateRange", "last30days"),
-            "metrics": ["itemRevenue", "itemsPurchased", "itemsViewed"],
-            "dimensions": args.get("dimensions", ["itemName", "itemCategory"]),
-            "orderBy": {"metric": "itemRevenue", "desc": True},
-            "limit": 30,
-        }
-
-        return await self.base._get_report(base_args)
+    async def _template_report(self, op: str, args: Dict[str, Any]) -> str:
+        base_args = _template_args(op, args)
+        return await self._cached_report(base_args, _cache_ttl(args))
 
     async def _get_user_journey(self, args: Dict[str, Any]) -> str:
-        property_id = args.get("propertyId", "")
         start_page = args.get("startPage", "/")
         end_page = args.get("endPage", "")
 
-        if not property_id:
-            return "❌ Missing required parameter: 'propertyId'"
+        base_args = _template_args("getUserJourney", args)
 
-        base_args = {
-            "propertyId": property_id,
-            "dateRange": args.get("dateRange", "last7days"),
-            "metrics": ["screenPageViews", "sessions"],
-            "dimensions": ["pagePath", "pageTitle"],
-            "orderBy": {"metric": "screenPageViews", "desc": True},
-            "limit": 100,
-        }
-
-        result = await self.base._get_report(base_args)
+        result = await self._cached_report(base_args, _cache_ttl(args))
         return f"🔍 User Journey Analysis\n\nPages visited between '{start_page}' and '{end_page}':\n\n{result}\n\nNote: Full path analysis requires custom implementation with GA4 Data API."
 
     async def _get_funnel_report(self, args: Dict[str, Any]) -> str:
-        property_id = args.get("propertyId", "")
         funnel_steps = args.get("funnelSteps", [])
 
-        if not property_id or not funnel_steps:
-            return "❌ Missing required parameters: 'propertyId' and 'funnelSteps'"
-
-        output = ["📊 Funnel Analysis:\n"]
-
-        for i, step in enumerate(funnel_steps, 1):
-            step_name = step.get("name", f"Step {i}")
-            step_page = step.get("page", "")
-
-            base_args = {
-                "propertyId": property_id,
-                "dateRange": args.get("dateRange", "last30days"),
-                "metrics": ["screenPageViews", "sessions"],
-                "dimensions": ["pagePath"],
-            }
-
-            step_result = await self.base._get_report(base_args)
-            output.append(f"\n{i}. {step_name} ({step_page})")
-            output.append(f"   Users: [analyzing...]")
-
-        output.append("\n\nNote: Full funnel analysis with drop-off rates requires GA4 Funnel Exploration API.")
+        base_args = _template_args("getFunnelReport", args)
+        result = await self._cached_report(base_args, _cache_ttl(args))
+
+        output = ["📊 Funnel Analysis:", ""]
+        output.extend(
+            f"{i}. {step.get('name', f'Step {i}')} ({step.get('page', '')})"
+            for i, step in enumerate(funnel_steps, 1)
+        )
+        output += [
+            "",
+            "Page views by path:",
+            "",
+            result,
+            "",
+            "Note: Full funnel analysis with drop-off rates requires GA4 Funnel Exploration API.",
+        ]
         return "\n".join(output)
 
     async def _custom_query(self, args: Dict[str, Any]) -> str:
-        property_id = args.get("propertyId", "")
-
-        if not property_id:
-            return "❌ Missing required parameter: 'propertyId'"
-
-        base_args = {
-            "propertyId": property_id,
-            "dateRange": args.get("dateRange", "last30days"),
-            "metrics": args.get("metrics", ["sessions"]),
-            "dimensions": args.get("dimensions", []),
-            "orderBy": args.get("orderBy"),
-            "limit": args.get("limit", 100),
-        }
+        base_args = {k: list(v) if isinstance(v, tuple) else v for k, v in _CUSTOM_QUERY_DEFAULTS}
+        base_args["propertyId"] = args.get("propertyId", "")
+        for k, _ in _CUSTOM_QUERY_DEFAULTS:
+            v = args.get(k)
+            if v is not None:
+                base_args[k] = v
 
         if args.get("startDate") and args.get("endDate"):
             base_args["startDate"] = args["startDate"]
             base_args["endDate"] = args["endDate"]
             base_args["dateRange"] = "custom"
 
-        result = await self.base._get_report(base_args)
+        metrics = _as_tuple(base_args["metrics"])
+        dimensions = _as_tuple(base_args["dimensions"])
+        if len(dimensions) > GA4_MAX_DIMENSIONS:
+            return f"❌ GA4 reports allow at most {GA4_MAX_DIMENSIONS} dimensions, got {len(dimensions)}"
+
+        if len(metrics) <= GA4_MAX_METRICS:
+            result = await self._cached_report(base_args, _cache_ttl(args))
+        else:
+            # Over the per-report metric limit: one report per metric chunk, run concurrently
+            chunks = [list(metrics[i:i + GA4_MAX_METRICS]) for i in range(0, len(metrics), GA4_MAX_METRICS)]
+            order_by = base_args.get("orderBy")
+            sub_args = []
+            for chunk in chunks:
+                a = dict(base_args, metrics=chunk)
+                if isinstance(order_by, dict) and order_by.get("metric") not in chunk:
+                    a["orderBy"] = None
+                sub_args.append(a)
+            results = await asyncio.gather(*[self._cached_report(a, _cache_ttl(args)) for a in sub_args])
+            parts = [f"Split into {len(chunks)} reports, GA4 allows {GA4_MAX_METRICS} metrics per report. Rows are not joined across parts."]
+            parts.extend(f"Metrics: {', '.join(chunk)}\n\n{r}" for chunk, r in zip(chunks, results))
+            result = "\n\n".join(parts)
 
         filters = args.get("filters", [])
         if filters:
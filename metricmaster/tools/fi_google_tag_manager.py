@@ -1,16 +1,26 @@
+import asyncio
+import functools
 import logging
+import re
+import sys
+import threading
 import time
 from typing import Dict, Any, Optional, List
 
 import gql.transport.exceptions
-import google.oauth2.credentials
-import googleapiclient.discovery
-import googleapiclient.errors
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from flexus_client_kit import ckit_cloudtool
 from flexus_client_kit import ckit_client
 from flexus_client_kit import ckit_external_auth
 
+# googleapiclient, httplib2 and google.auth are imported where they are used, so loading this module
+# for the tool definition and HELP doesn't pay for them
+
 logger = logging.getLogger("google_tag_manager")
 
 GOOGLE_TAG_MANAGER_TOOL = ckit_cloudtool.CloudTool(
@@ -119,7 +129,7 @@ google_tag_manager(op="linkGA4", args={
     "workspaceId": "10",
     "measurementId": "G-XXXXXXXXXX"
 })
-    Create GA4 configuration tag and link it to GTM.
+    Create GA4 configuration tag and link it to GTM. Adds an 'All Pages' trigger if the workspace has none.
 
 # Common Usage Examples:
 
@@ -149,6 +159,32 @@ google_tag_manager(op="createTag", args={
 })
 """
 
+# Words and op names appearing in HELP
+HELP_TOKENS = frozenset(re.findall(r"\w+", HELP))
+
+# Installation snippet shown by getContainer, only the container public ID varies
+_CONTAINER_SNIPPET_TEMPLATE = """
+🔧 Container Snippet Code:
+
+Add this to your website's <head> section:
+```html
+<!-- Google Tag Manager -->
+<script>(function(w,d,s,l,i){{w[l]=w[l]||[];w[l].push({{'gtm.start':
+new Date().getTime(),event:'gtm.js'}});var f=d.getElementsByTagName(s)[0],
+j=d.createElement(s),dl=l!='dataLayer'?'&l='+l:'';j.async=true;j.src=
+'https://www.googletagmanager.com/gtm.js?id='+i+dl;f.parentNode.insertBefore(j,f);
+}})(window,document,'script','dataLayer','{public_id}');</script>
+<!-- End Google Tag Manager -->
+```
+
+Add this immediately after opening <body> tag:
+```html
+<!-- Google Tag Manager (noscript) -->
+<noscript><iframe src="https://www.googletagmanager.com/ns.html?id={public_id}"
+height="0" width="0" style="display:none;visibility:hidden"></iframe></noscript>
+<!-- End Google Tag Manager (noscript) -->
+```"""
+
 GOOGLE_TAG_MANAGER_SETUP_SCHEMA = [
     {
         "bs_name": "GTM_DEFAULT_ACCOUNT",
@@ -171,6 +207,89 @@ REQUIRED_SCOPES = [
     "https://www.googleapis.com/auth/tagmanager.readonly",
 ]
 
+# Ops whose handlers need the toolcall to ask for human confirmation
+_WRITE_OPS = frozenset({
+    "createContainer",
+    "createTag",
+    "createTrigger",
+    "createVariable",
+    "createVersion",
+    "publishVersion",
+    "linkGA4",
+})
+
+# linkGA4 replies, only the tag name and ID vary
+_OK_ALL_PAGES_CREATED = "✅ Created 'All Pages' pageview trigger\n"
+_OK_GA4_LINKED = (
+    "✅ Created GA4 configuration tag: {name} (ID: {tag_id})\n\n"
+    "GA4 is now linked to GTM. Create a version and publish to make it live."
+)
+
+DEFAULT_WORKSPACE_TTL = 300.0
+ACCOUNT_LIST_TTL = 300.0
+TOKEN_REFRESH_SLACK = 300.0
+HTTP_TIMEOUT = 30
+
+
+@functools.lru_cache(maxsize=256)
+def _workspace_path(account_id: str, container_id: str, workspace_id: str) -> str:
+    # Same few workspaces are addressed over and over, build and intern each path once
+    return sys.intern(f"accounts/{account_id}/containers/{container_id}/workspaces/{workspace_id}")
+
+
+def _json_model():
+    # googleapiclient's JsonModel with orjson parsing responses, None means the stock model. Request bodies
+    # keep the stock ASCII-escaped json.dumps, http.client encodes str bodies as latin-1
+    if orjson is None:
+        return None
+    import googleapiclient.model
+
+    class OrjsonModel(googleapiclient.model.JsonModel):
+        def deserialize(self, content):
+            try:
+                body = orjson.loads(content)
+            except orjson.JSONDecodeError:
+                return content.decode("utf-8") if isinstance(content, bytes) else content
+            if self._data_wrapper and "data" in body:
+                body = body["data"]
+            return body
+
+    return OrjsonModel()
+
+
+@functools.lru_cache(maxsize=1)
+def _service():
+    import googleapiclient.discovery
+    import googleapiclient.discovery_cache
+    import httplib2
+    # One Resource tree per process, shared by all users: it only builds requests, and every request is
+    # executed with the calling user's credentials (see IntegrationGoogleTagManager._exec). The bare Http
+    # keeps build() from looking up application default credentials.
+    doc = googleapiclient.discovery_cache.get_static_doc("tagmanager", "v2")
+    if doc:
+        return googleapiclient.discovery.build_from_document(doc, http=httplib2.Http(), model=_json_model())
+    return googleapiclient.discovery.build('tagmanager', 'v2', http=httplib2.Http(), model=_json_model())
+
+
+# (ws_id, fuser_id) -> (token, monotonic refresh deadline), shared by every integration instance in this process
+_TOKEN_CACHE: Dict[tuple[str, str], tuple[Any, float]] = {}
+
+_thread_local = threading.local()
+
+
+def _thread_http():
+    # httplib2.Http is not thread-safe, each worker thread keeps its own connection
+    import httplib2
+    http = getattr(_thread_local, "http", None)
+    if http is None:
+        http = _thread_local.http = httplib2.Http(timeout=HTTP_TIMEOUT)
+    return http
+
+
+def _log_prefetch_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.info("Default workspace prefetch failed: %s", task.exception())
+
 
 class IntegrationGoogleTagManager:
 
@@ -178,34 +297,155 @@ class IntegrationGoogleTagManager:
         self,
         fclient: ckit_client.FlexusClient,
         rcx,
+        setup: Optional[Dict[str, Any]] = None,
     ):
         self.fclient = fclient
         self.rcx = rcx
+        self.setup = setup or {}
+        self._prefetch_task: Optional[asyncio.Task] = None
         self.token_data = None
+        self._token_refresh_at = 0.0
+        self._auth_lock = asyncio.Lock()
+        self.creds = None
         self.service = None
+        self._accounts = None
+        self._containers = None
+        self._versions = None
+        self._workspaces = None
+        self._tags = None
+        self._triggers = None
+        self._variables = None
+        self._default_ws_cache: Dict[tuple[str, str], tuple[str, float]] = {}
+        self._default_ws_locks: Dict[tuple[str, str], asyncio.Lock] = {}
+        self._all_pages_trigger_cache: Dict[tuple[str, str, str], tuple[str, float]] = {}
+        self._account_list_cache: Dict[tuple[str, ...], tuple[List[Dict[str, Any]], float]] = {}
+        self._ops = {
+            "listAccounts": self._list_accounts,
+            "listContainers": self._list_containers,
+            "getContainer": self._get_container,
+            "createContainer": self._create_container,
+            "listTags": self._list_tags,
+            "createTag": self._create_tag,
+            "listTriggers": self._list_triggers,
+            "createTrigger": self._create_trigger,
+            "listVariables": self._list_variables,
+            "createVariable": self._create_variable,
+            "createVersion": self._create_version,
+            "publishVersion": self._publish_version,
+            "linkGA4": self._link_ga4,
+        }
 
     async def _ensure_service(self) -> bool:
-        if self.service and self.token_data and time.time() < self.token_data.expires_at - 60:
+        if self.service and self.token_data and time.monotonic() < self._token_refresh_at:
             return True
 
-        try:
-            self.token_data = await ckit_external_auth.get_external_auth_token(
-                self.fclient,
-                "google",
-                self.rcx.persona.ws_id,
-                self.rcx.persona.owner_fuser_id,
-            )
-        except gql.transport.exceptions.TransportQueryError:
-            return False
+        # Concurrent callers wait for one token fetch instead of each starting their own
+        async with self._auth_lock:
+            if self.service and self.token_data and time.monotonic() < self._token_refresh_at:
+                return True
 
-        if not self.token_data:
-            return False
+            token_key = (self.rcx.persona.ws_id, self.rcx.persona.owner_fuser_id)
+            cached = _TOKEN_CACHE.get(token_key)
+            if cached is not None and time.monotonic() < cached[1]:
+                self.token_data, self._token_refresh_at = cached
+            else:
+                try:
+                    self.token_data = await ckit_external_auth.get_external_auth_token(
+                        self.fclient,
+                        "google",
+                        self.rcx.persona.ws_id,
+                        self.rcx.persona.owner_fuser_id,
+                    )
+                except gql.transport.exceptions.TransportQueryError:
+                    return False
+
+                if not self.token_data:
+                    return False
+                # expires_at is wall-clock, convert once so clock steps can't cause spurious refreshes
+                self._token_refresh_at = time.monotonic() + (self.token_data.expires_at - time.time()) - TOKEN_REFRESH_SLACK
+                _TOKEN_CACHE[token_key] = (self.token_data, self._token_refresh_at)
+
+            import google.oauth2.credentials
+            self.creds = google.oauth2.credentials.Credentials(token=self.token_data.access_token)
+            self.service = _service()
+            # Resource objects are stateless request builders, resolve the chain once
+            self._accounts = self.service.accounts()
+            self._containers = self._accounts.containers()
+            self._versions = self._containers.versions()
+            self._workspaces = self._containers.workspaces()
+            self._tags = self._workspaces.tags()
+            self._triggers = self._workspaces.triggers()
+            self._variables = self._workspaces.variables()
+
+            logger.info("Google Tag Manager service initialized for user %s", self.rcx.persona.owner_fuser_id)
+            self._prefetch_default_workspace()
+            return True
 
-        creds = google.oauth2.credentials.Credentials(token=self.token_data.access_token)
-        self.service = googleapiclient.discovery.build('tagmanager', 'v2', credentials=creds)
+    def _drop_token(self) -> None:
+        _TOKEN_CACHE.pop((self.rcx.persona.ws_id, self.rcx.persona.owner_fuser_id), None)
+        self.token_data = None
 
-        logger.info("Google Tag Manager service initialized for user %s", self.rcx.persona.owner_fuser_id)
-        return True
+    def _prefetch_default_workspace(self) -> None:
+        # Warm the workspace cache for the configured container while the caller gets on with its op
+        account_id = self.setup.get("GTM_DEFAULT_ACCOUNT", "")
+        container_id = self.setup.get("GTM_DEFAULT_CONTAINER", "")
+        if not account_id or not container_id or (account_id, container_id) in self._default_ws_cache:
+            return
+        self._prefetch_task = asyncio.create_task(self._default_workspace_id(account_id, container_id))
+        self._prefetch_task.add_done_callback(_log_prefetch_failure)
+
+    async def _resolve_workspace(self, account_id: str, container_id: str, workspace_id: str) -> str:
+        return workspace_id or await self._default_workspace_id(account_id, container_id)
+
+    async def _default_workspace_id(self, account_id: str, container_id: str) -> str:
+        key = (account_id, container_id)
+        hit = self._default_ws_cache.get(key)
+        if hit is not None and time.monotonic() < hit[1]:
+            return hit[0]
+
+        lock = self._default_ws_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            hit = self._default_ws_cache.get(key)
+            if hit is not None and time.monotonic() < hit[1]:
+                return hit[0]
+            workspaces = await self._exec(self._workspaces.list(
+                parent=f"accounts/{account_id}/containers/{container_id}",
+                fields="workspace(workspaceId)",
+            ))
+            workspace_id = workspaces.get("workspace", [{}])[0].get("workspaceId", "")
+            if workspace_id:
+                self._default_ws_cache[key] = (workspace_id, time.monotonic() + DEFAULT_WORKSPACE_TTL)
+            return workspace_id
+
+    async def _exec(self, request) -> Dict[str, Any]:
+        # googleapiclient is synchronous, keep its HTTP round-trips off the event loop. The credentials carry
+        # no refresh token, refresh_status_codes=() hands a 401 back as HttpError for called_by_model to refetch
+        import google_auth_httplib2
+        creds = self.creds
+        return await asyncio.to_thread(
+            lambda: request.execute(http=google_auth_httplib2.AuthorizedHttp(
+                creds, http=_thread_http(), refresh_status_codes=(),
+            ))
+        )
+
+    async def _list_all(self, resource, key: str, fields: str, **kwargs) -> List[Dict[str, Any]]:
+        # Follow nextPageToken and only transfer the fields the listing prints
+        request = resource.list(fields=f"nextPageToken,{key}({fields})", **kwargs)
+        items: List[Dict[str, Any]] = []
+        while request is not None:
+            response = await self._exec(request)
+            items.extend(response.get(key, []))
+            request = resource.list_next(request, response)
+        return items
+
+    async def _list_all_cached(self, cache_key: tuple[str, ...], resource, key: str, fields: str, **kwargs) -> List[Dict[str, Any]]:
+        # Accounts and containers rarely change, the model lists them again and again within a session
+        hit = self._account_list_cache.get(cache_key)
+        if hit is not None and time.monotonic() < hit[1]:
+            return hit[0]
+        items = await self._list_all(resource, key, fields, **kwargs)
+        self._account_list_cache[cache_key] = (items, time.monotonic() + ACCOUNT_LIST_TTL)
+        return items
 
     async def called_by_model(
         self,
@@ -220,8 +460,11 @@ class IntegrationGoogleTagManager:
         if args_error:
             return args_error
 
-        print_help = not op or "help" in op
-        print_status = not op or "status" in op
+        print_help = not op or op == "help"
+        print_status = not op or op == "status"
+
+        if print_help and not print_status:
+            return HELP
 
         authenticated = await self._ensure_service()
 
@@ -248,9 +491,6 @@ class IntegrationGoogleTagManager:
                     r += f"\n❌ Error initiating OAuth: {e}\n"
             return r
 
-        if print_help:
-            return HELP
-
         if not authenticated:
             try:
                 auth_url = await ckit_external_auth.start_external_auth_flow(
@@ -270,102 +510,96 @@ class IntegrationGoogleTagManager:
             except gql.transport.exceptions.TransportQueryError as e:
                 return f"❌ Failed to initiate OAuth: {e}"
 
+        import googleapiclient.errors
         try:
-            if op == "listAccounts":
-                return await self._list_accounts(args)
-            elif op == "listContainers":
-                return await self._list_containers(args)
-            elif op == "getContainer":
-                return await self._get_container(args)
-            elif op == "createContainer":
-                return await self._create_container(toolcall, args)
-            elif op == "listTags":
-                return await self._list_tags(args)
-            elif op == "createTag":
-                return await self._create_tag(toolcall, args)
-            elif op == "listTriggers":
-                return await self._list_triggers(args)
-            elif op == "createTrigger":
-                return await self._create_trigger(toolcall, args)
-            elif op == "listVariables":
-                return await self._list_variables(args)
-            elif op == "createVariable":
-                return await self._create_variable(toolcall, args)
-            elif op == "createVersion":
-                return await self._create_version(toolcall, args)
-            elif op == "publishVersion":
-                return await self._publish_version(toolcall, args)
-            elif op == "linkGA4":
-                return await self._link_ga4(toolcall, args)
-            else:
-                return f"❌ Unknown operation: {op}\n\nTry google_tag_manager(op='help') for usage."
-
+            return await self._dispatch(toolcall, op, args)
         except googleapiclient.errors.HttpError as e:
-            if e.resp.status in (401, 403):
-                self.token_data = None
-                self.service = None
-                auth_url = await ckit_external_auth.start_external_auth_flow(
-                    self.fclient,
-                    "google",
-                    self.rcx.persona.ws_id,
-                    self.rcx.persona.owner_fuser_id,
-                    REQUIRED_SCOPES,
-                )
-                return f"❌ Google Tag Manager authentication error: {e.resp.status}\n\nPlease authorize at:\n{auth_url}\n\nThen retry."
-            error_msg = f"Google Tag Manager API error: {e.resp.status} - {str(e)}"
-            logger.error(error_msg)
-            return f"❌ {error_msg}"
+            error = e
 
-    async def _list_accounts(self, args: Dict[str, Any]) -> str:
-        try:
-            accounts = self.service.accounts().list().execute()
+        if error.resp.status == 401 and await self._refetch_token():
+            try:
+                return await self._dispatch(toolcall, op, args)
+            except googleapiclient.errors.HttpError as e:
+                error = e
+
+        status = error.resp.status
+        if status in (401, 403):
+            self._drop_token()
+            self.service = None
+            auth_url = await ckit_external_auth.start_external_auth_flow(
+                self.fclient,
+                "google",
+                self.rcx.persona.ws_id,
+                self.rcx.persona.owner_fuser_id,
+                REQUIRED_SCOPES,
+            )
+            return f"❌ Google Tag Manager authentication error: {status}\n\nPlease authorize at:\n{auth_url}\n\nThen retry."
+        error_msg = f"Google Tag Manager API error: {status} - {str(error)}"
+        logger.error(error_msg)
+        return f"❌ {error_msg}"
+
+    async def _refetch_token(self) -> bool:
+        # Token rejected before its expiry: ask for a fresh one, refresh tokens are kept by the auth backend
+        stale = self.token_data.access_token if self.token_data else None
+        self._drop_token()
+        return await self._ensure_service() and self.token_data.access_token != stale
+
+    async def _dispatch(self, toolcall: ckit_cloudtool.FCloudtoolCall, op: str, args: Dict[str, Any]) -> str:
+        handler = self._ops.get(op)
+        if handler is None:
+            return f"❌ Unknown operation: {op}\n\nTry google_tag_manager(op='help') for usage."
+        if op in _WRITE_OPS:
+            return await handler(toolcall, args)
+        return await handler(args)
 
-            if not accounts.get("account"):
-                return "📦 No Google Tag Manager accounts found."
+    async def _list_accounts(self, args: Dict[str, Any]) -> str:
+        accounts = await self._list_all_cached(("accounts",), self._accounts, "account", "name,accountId")
 
-            output = ["📦 Google Tag Manager Accounts:\n"]
+        if not accounts:
+            return "📦 No Google Tag Manager accounts found."
 
-            for account in accounts.get("account", []):
-                account_name = account.get("name", "Unknown")
-                account_id = account.get("accountId", "")
-                output.append(f"• {account_name} (ID: {account_id})")
+        output = ["📦 Google Tag Manager Accounts:\n"]
 
-            return "\n".join(output)
+        for account in accounts:
+            account_name = account.get("name", "Unknown")
+            account_id = account.get("accountId", "")
+            output.append(f"• {account_name} (ID: {account_id})")
 
-        except googleapiclient.errors.HttpError as e:
-            raise
+        return "\n".join(output)
 
     async def _list_containers(self, args: Dict[str, Any]) -> str:
         account_id = args.get("accountId", "")
         if not account_id:
             return "❌ Missing required parameter: 'accountId'"
 
-        try:
-            containers = self.service.accounts().containers().list(
-                parent=f"accounts/{account_id}"
-            ).execute()
-
-            if not containers.get("container"):
-                return f"📦 No containers found in account {account_id}"
-
-            output = [f"📦 Containers in Account {account_id}:\n"]
-
-            for container in containers.get("container", []):
-                container_name = container.get("name", "Unknown")
-                container_id = container.get("containerId", "")
-                public_id = container.get("publicId", "")
-                usage_context = ", ".join(container.get("usageContext", []))
-                output.append(f"• {container_name}")
-                output.append(f"  ID: {container_id}")
-                output.append(f"  Public ID: {public_id}")
-                output.append(f"  Type: {usage_context}\n")
-
-            return "\n".join(output)
+        containers = await self._list_all_cached(
+            ("containers", account_id),
+            self._containers, "container", "name,containerId,publicId,usageContext",
+            parent=f"accounts/{account_id}",
+        )
+
+        if not containers:
+            return f"📦 No containers found in account {account_id}"
+
+        output = [f"📦 Containers in Account {account_id}:\n"]
+
+        for container in containers:
+            container_name = container.get("name", "Unknown")
+            container_id = container.get("containerId", "")
+            public_id = container.get("publicId", "")
+            usage_context = ", ".join(container.get("usageContext", []))
+            output.append(
+                f"• {container_name}\n"
+                f"  ID: {container_id}\n"
+                f"  Public ID: {public_id}\n"
+                f"  Type: {usage_context}\n"
+            )
 
-        except googleapiclient.errors.HttpError as e:
-            raise
+        return "\n".join(output)
 
     async def _get_container(self, args: Dict[str, Any]) -> str:
+        import googleapiclient.errors
+
         account_id = args.get("accountId", "")
         container_id = args.get("containerId", "")
 
@@ -373,9 +607,9 @@ class IntegrationGoogleTagManager:
             return "❌ Missing required parameters: 'accountId' and 'containerId'"
 
         try:
-            container = self.service.accounts().containers().get(
+            container = await self._exec(self._containers.get(
                 path=f"accounts/{account_id}/containers/{container_id}"
-            ).execute()
+            ))
 
             output = [
                 "📦 Container Details:\n",
@@ -384,24 +618,7 @@ class IntegrationGoogleTagManager:
                 f"Public ID: {container.get('publicId', '')}",
                 f"Usage Context: {', '.join(container.get('usageContext', []))}",
                 f"Time Zone: {container.get('timeZoneId', 'Unknown')}",
-                "\n🔧 Container Snippet Code:",
-                "\nAdd this to your website's <head> section:",
-                "```html",
-                f"<!-- Google Tag Manager -->",
-                f"<script>(function(w,d,s,l,i){{w[l]=w[l]||[];w[l].push({{'gtm.start':",
-                f"new Date().getTime(),event:'gtm.js'}});var f=d.getElementsByTagName(s)[0],",
-                f"j=d.createElement(s),dl=l!='dataLayer'?'&l='+l:'';j.async=true;j.src=",
-                f"'https://www.googletagmanager.com/gtm.js?id='+i+dl;f.parentNode.insertBefore(j,f);",
-                f"}})(window,document,'script','dataLayer','{container.get('publicId', '')}');</script>",
-                f"<!-- End Google Tag Manager -->",
-                "```",
-                "\nAdd this immediately after opening <body> tag:",
-                "```html",
-                f"<!-- Google Tag Manager (noscript) -->",
-                f"<noscript><iframe src=\"https://www.googletagmanager.com/ns.html?id={container.get('publicId', '')}\"",
-                f"height=\"0\" width=\"0\" style=\"display:none;visibility:hidden\"></iframe></noscript>",
-                f"<!-- End Google Tag Manager (noscript) -->",
-                "```",
+                _CONTAINER_SNIPPET_TEMPLATE.format(public_id=container.get('publicId', '')),
             ]
 
             return "\n".join(output)
@@ -426,19 +643,16 @@ class IntegrationGoogleTagManager:
         if not account_id or not container_name:
             return "❌ Missing required parameters: 'accountId' and 'containerName'"
 
-        try:
-            container = self.service.accounts().containers().create(
-                parent=f"accounts/{account_id}",
-                body={
-                    "name": container_name,
-                    "usageContext": usage_context,
-                }
-            ).execute()
-
-            return f"✅ Created container: {container.get('name')} (ID: {container.get('containerId')})"
+        container = await self._exec(self._containers.create(
+            parent=f"accounts/{account_id}",
+            body={
+                "name": container_name,
+                "usageContext": usage_context,
+            }
+        ))
+        self._account_list_cache.pop(("containers", account_id), None)
 
-        except googleapiclient.errors.HttpError as e:
-            raise
+        return f"✅ Created container: {container.get('name')} (ID: {container.get('containerId')})"
 
     async def _list_tags(self, args: Dict[str, Any]) -> str:
         account_id = args.get("accountId", "")
@@ -448,32 +662,25 @@ class IntegrationGoogleTagManager:
         if not account_id or not container_id:
             return "❌ Missing required parameters: 'accountId' and 'containerId'"
 
-        if not workspace_id:
-            workspaces = self.service.accounts().containers().workspaces().list(
-                parent=f"accounts/{account_id}/containers/{container_id}"
-            ).execute()
-            workspace_id = workspaces.get("workspace", [{}])[0].get("workspaceId", "")
-
-        try:
-            tags = self.service.accounts().containers().workspaces().tags().list(
-                parent=f"accounts/{account_id}/containers/{container_id}/workspaces/{workspace_id}"
-            ).execute()
+        workspace_id = await self._resolve_workspace(account_id, container_id, workspace_id)
 
-            if not tags.get("tag"):
-                return f"🏷️ No tags found in workspace {workspace_id}"
+        tags = await self._list_all(
+            self._tags, "tag", "name,tagId,type",
+            parent=_workspace_path(account_id, container_id, workspace_id),
+        )
 
-            output = [f"🏷️ Tags in Workspace {workspace_id}:\n"]
+        if not tags:
+            return f"🏷️ No tags found in workspace {workspace_id}"
 
-            for tag in tags.get("tag", []):
-                tag_name = tag.get("name", "Unknown")
-                tag_id = tag.get("tagId", "")
-                tag_type = tag.get("type", "")
-                output.append(f"• {tag_name} (ID: {tag_id}, Type: {tag_type})")
+        output = [f"🏷️ Tags in Workspace {workspace_id}:\n"]
 
-            return "\n".join(output)
+        for tag in tags:
+            tag_name = tag.get("name", "Unknown")
+            tag_id = tag.get("tagId", "")
+            tag_type = tag.get("type", "")
+            output.append(f"• {tag_name} (ID: {tag_id}, Type: {tag_type})")
 
-        except googleapiclient.errors.HttpError as e:
-            raise
+        return "\n".join(output)
 
     async def _create_tag(self, toolcall: ckit_cloudtool.FCloudtoolCall, args: Dict[str, Any]) -> str:
         if not toolcall.confirmed_by_human:
@@ -494,27 +701,19 @@ class IntegrationGoogleTagManager:
         if not account_id or not container_id or not tag_name or not tag_type:
             return "❌ Missing required parameters: 'accountId', 'containerId', 'tagName', 'tagType'"
 
-        if not workspace_id:
-            workspaces = self.service.accounts().containers().workspaces().list(
-                parent=f"accounts/{account_id}/containers/{container_id}"
-            ).execute()
-            workspace_id = workspaces.get("workspace", [{}])[0].get("workspaceId", "")
+        workspace_id = await self._resolve_workspace(account_id, container_id, workspace_id)
 
-        try:
-            tag = self.service.accounts().containers().workspaces().tags().create(
-                parent=f"accounts/{account_id}/containers/{container_id}/workspaces/{workspace_id}",
-                body={
-                    "name": tag_name,
-                    "type": tag_type,
-                    "parameter": parameters,
-                    "firingTriggerId": firing_trigger_id,
-                }
-            ).execute()
-
-            return f"✅ Created tag: {tag.get('name')} (ID: {tag.get('tagId')})"
+        tag = await self._exec(self._tags.create(
+            parent=_workspace_path(account_id, container_id, workspace_id),
+            body={
+                "name": tag_name,
+                "type": tag_type,
+                "parameter": parameters,
+                "firingTriggerId": firing_trigger_id,
+            }
+        ))
 
-        except googleapiclient.errors.HttpError as e:
-            raise
+        return f"✅ Created tag: {tag.get('name')} (ID: {tag.get('tagId')})"
 
     async def _list_triggers(self, args: Dict[str, Any]) -> str:
         account_id = args.get("accountId", "")
@@ -524,32 +723,25 @@ class IntegrationGoogleTagManager:
         if not account_id or not container_id:
             return "❌ Missing required parameters: 'accountId' and 'containerId'"
 
-        if not workspace_id:
-            workspaces = self.service.accounts().containers().workspaces().list(
-                parent=f"accounts/{account_id}/containers/{container_id}"
-            ).execute()
-            workspace_id = workspaces.get("workspace", [{}])[0].get("workspaceId", "")
-
-        try:
-            triggers = self.service.accounts().containers().workspaces().triggers().list(
-                parent=f"accounts/{account_id}/containers/{container_id}/workspaces/{workspace_id}"
-            ).execute()
+        workspace_id = await self._resolve_workspace(account_id, container_id, workspace_id)
 
-            if not triggers.get("trigger"):
-                return f"⚡ No triggers found in workspace {workspace_id}"
+        triggers = await self._list_all(
+            self._triggers, "trigger", "name,triggerId,type",
+            parent=_workspace_path(account_id, container_id, workspace_id),
+        )
 
-            output = [f"⚡ Triggers in Workspace {workspace_id}:\n"]
+        if not triggers:
+            return f"⚡ No triggers found in workspace {workspace_id}"
 
-            for trigger in triggers.get("trigger", []):
-                trigger_name = trigger.get("name", "Unknown")
-                trigger_id = trigger.get("triggerId", "")
-                trigger_type = trigger.get("type", "")
-                output.append(f"• {trigger_name} (ID: {trigger_id}, Type: {trigger_type})")
+        output = [f"⚡ Triggers in Workspace {workspace_id}:\n"]
 
-            return "\n".join(output)
+        for trigger in triggers:
+            trigger_name = trigger.get("name", "Unknown")
+            trigger_id = trigger.get("triggerId", "")
+            trigger_type = trigger.get("type", "")
+            output.append(f"• {trigger_name} (ID: {trigger_id}, Type: {trigger_type})")
 
-        except googleapiclient.errors.HttpError as e:
-            raise
+        return "\n".join(output)
 
     async def _create_trigger(self, toolcall: ckit_cloudtool.FCloudtoolCall, args: Dict[str, Any]) -> str:
         if not toolcall.confirmed_by_human:
@@ -569,26 +761,18 @@ class IntegrationGoogleTagManager:
         if not account_id or not container_id or not trigger_name or not trigger_type:
             return "❌ Missing required parameters: 'accountId', 'containerId', 'triggerName', 'triggerType'"
 
-        if not workspace_id:
-            workspaces = self.service.accounts().containers().workspaces().list(
-                parent=f"accounts/{account_id}/containers/{container_id}"
-            ).execute()
-            workspace_id = workspaces.get("workspace", [{}])[0].get("workspaceId", "")
-
-        try:
-            trigger = self.service.accounts().containers().workspaces().triggers().create(
-                parent=f"accounts/{account_id}/containers/{container_id}/workspaces/{workspace_id}",
-                body={
-                    "name": trigger_name,
-                    "type": trigger_type,
-                    "filter": filters,
-                }
-            ).execute()
+        workspace_id = await self._resolve_workspace(account_id, container_id, workspace_id)
 
-            return f"✅ Created trigger: {trigger.get('name')} (ID: {trigger.get('triggerId')})"
+        trigger = await self._exec(self._triggers.create(
+            parent=_workspace_path(account_id, container_id, workspace_id),
+            body={
+                "name": trigger_name,
+                "type": trigger_type,
+                "filter": filters,
+            }
+        ))
 
-        except googleapiclient.errors.HttpError as e:
-            raise
+        return f"✅ Created trigger: {trigger.get('name')} (ID: {trigger.get('triggerId')})"
 
     async def _list_variables(self, args: Dict[str, Any]) -> str:
         account_id = args.get("accountId", "")
@@ -598,32 +782,25 @@ class IntegrationGoogleTagManager:
         if not account_id or not container_id:
             return "❌ Missing required parameters: 'accountId' and 'containerId'"
 
-        if not workspace_id:
-            workspaces = self.service.accounts().containers().workspaces().list(
-                parent=f"accounts/{account_id}/containers/{container_id}"
-            ).execute()
-            workspace_id = workspaces.get("workspace", [{}])[0].get("workspaceId", "")
-
-        try:
-            variables = self.service.accounts().containers().workspaces().variables().list(
-                parent=f"accounts/{account_id}/containers/{container_id}/workspaces/{workspace_id}"
-            ).execute()
+        workspace_id = await self._resolve_workspace(account_id, container_id, workspace_id)
 
-            if not variables.get("variable"):
-                return f"📊 No variables found in workspace {workspace_id}"
+        variables = await self._list_all(
+            self._variables, "variable", "name,variableId,type",
+            parent=_workspace_path(account_id, container_id, workspace_id),
+        )
 
-            output = [f"📊 Variables in Workspace {workspace_id}:\n"]
+        if not variables:
+            return f"📊 No variables found in workspace {workspace_id}"
 
-            for variable in variables.get("variable", []):
-                variable_name = variable.get("name", "Unknown")
-                variable_id = variable.get("variableId", "")
-                variable_type = variable.get("type", "")
-                output.append(f"• {variable_name} (ID: {variable_id}, Type: {variable_type})")
+        output = [f"📊 Variables in Workspace {workspace_id}:\n"]
 
-            return "\n".join(output)
+        for variable in variables:
+            variable_name = variable.get("name", "Unknown")
+            variable_id = variable.get("variableId", "")
+            variable_type = variable.get("type", "")
+            output.append(f"• {variable_name} (ID: {variable_id}, Type: {variable_type})")
 
-        except googleapiclient.errors.HttpError as e:
-            raise
+        return "\n".join(output)
 
     async def _create_variable(self, toolcall: ckit_cloudtool.FCloudtoolCall, args: Dict[str, Any]) -> str:
         if not toolcall.confirmed_by_human:
@@ -643,28 +820,20 @@ class IntegrationGoogleTagManager:
         if not account_id or not container_id or not variable_name or not variable_type:
             return "❌ Missing required parameters: 'accountId', 'containerId', 'variableName', 'variableType'"
 
-        if not workspace_id:
-            workspaces = self.service.accounts().containers().workspaces().list(
-                parent=f"accounts/{account_id}/containers/{container_id}"
-            ).execute()
-            workspace_id = workspaces.get("workspace", [{}])[0].get("workspaceId", "")
+        workspace_id = await self._resolve_workspace(account_id, container_id, workspace_id)
 
-        try:
-            variable = self.service.accounts().containers().workspaces().variables().create(
-                parent=f"accounts/{account_id}/containers/{container_id}/workspaces/{workspace_id}",
-                body={
-                    "name": variable_name,
-                    "type": variable_type,
-                    "parameter": [
-                        {"key": "value", "type": "template", "value": value}
-                    ] if value else [],
-                }
-            ).execute()
-
-            return f"✅ Created variable: {variable.get('name')} (ID: {variable.get('variableId')})"
+        variable = await self._exec(self._variables.create(
+            parent=_workspace_path(account_id, container_id, workspace_id),
+            body={
+                "name": variable_name,
+                "type": variable_type,
+                "parameter": [
+                    {"key": "value", "type": "template", "value": value}
+                ] if value else [],
+            }
+        ))
 
-        except googleapiclient.errors.HttpError as e:
-            raise
+        return f"✅ Created variable: {variable.get('name')} (ID: {variable.get('variableId')})"
 
     async def _create_version(self, toolcall: ckit_cloudtool.FCloudtoolCall, args: Dict[str, Any]) -> str:
         if not toolcall.confirmed_by_human:
@@ -683,26 +852,18 @@ class IntegrationGoogleTagManager:
         if not account_id or not container_id:
             return "❌ Missing required parameters: 'accountId' and 'containerId'"
 
-        if not workspace_id:
-            workspaces = self.service.accounts().containers().workspaces().list(
-                parent=f"accounts/{account_id}/containers/{container_id}"
-            ).execute()
-            workspace_id = workspaces.get("workspace", [{}])[0].get("workspaceId", "")
+        workspace_id = await self._resolve_workspace(account_id, container_id, workspace_id)
 
-        try:
-            version = self.service.accounts().containers().workspaces().create_version(
-                path=f"accounts/{account_id}/containers/{container_id}/workspaces/{workspace_id}",
-                body={
-                    "name": version_name,
-                    "notes": version_notes,
-                }
-            ).execute()
-
-            container_version = version.get("containerVersion", {})
-            return f"✅ Created version: {container_version.get('name')} (ID: {container_version.get('containerVersionId')})"
+        version = await self._exec(self._workspaces.create_version(
+            path=_workspace_path(account_id, container_id, workspace_id),
+            body={
+                "name": version_name,
+                "notes": version_notes,
+            }
+        ))
 
-        except googleapiclient.errors.HttpError as e:
-            raise
+        container_version = version.get("containerVersion", {})
+        return f"✅ Created version: {container_version.get('name')} (ID: {container_version.get('containerVersionId')})"
 
     async def _publish_version(self, toolcall: ckit_cloudtool.FCloudtoolCall, args: Dict[str, Any]) -> str:
         if not toolcall.confirmed_by_human:
@@ -719,22 +880,18 @@ class IntegrationGoogleTagManager:
         if not account_id or not container_id or not version_id:
             return "❌ Missing required parameters: 'accountId', 'containerId', 'versionId'"
 
-        try:
-            published = self.service.accounts().containers().versions().publish(
-                path=f"accounts/{account_id}/containers/{container_id}/versions/{version_id}"
-            ).execute()
-
-            return f"✅ Published version to production: {published.get('containerVersion', {}).get('name')}"
+        published = await self._exec(self._versions.publish(
+            path=f"accounts/{account_id}/containers/{container_id}/versions/{version_id}"
+        ))
 
-        except googleapiclient.errors.HttpError as e:
-            raise
+        return f"✅ Published version to production: {published.get('containerVersion', {}).get('name')}"
 
     async def _link_ga4(self, toolcall: ckit_cloudtool.FCloudtoolCall, args: Dict[str, Any]) -> str:
         if not toolcall.confirmed_by_human:
             raise ckit_cloudtool.NeedsConfirmation(
                 confirm_setup_key="gtm_write",
                 confirm_command=f"link GA4 measurement ID: {args.get('measurementId', '')}",
-                confirm_explanation="This will create GA4 configuration tag in GTM",
+                confirm_explanation="This will create GA4 configuration tag in GTM, and an 'All Pages' trigger if there is none",
             )
 
         account_id = args.get("accountId", "")
@@ -745,38 +902,66 @@ class IntegrationGoogleTagManager:
         if not account_id or not container_id or not measurement_id:
             return "❌ Missing required parameters: 'accountId', 'containerId', 'measurementId'"
 
-        if not workspace_id:
-            workspaces = self.service.accounts().containers().workspaces().list(
-                parent=f"accounts/{account_id}/containers/{container_id}"
-            ).execute()
-            workspace_id = workspaces.get("workspace", [{}])[0].get("workspaceId", "")
+        workspace_id = await self._resolve_workspace(account_id, container_id, workspace_id)
 
-        triggers = self.service.accounts().containers().workspaces().triggers().list(
-            parent=f"accounts/{account_id}/containers/{container_id}/workspaces/{workspace_id}"
-        ).execute()
-        all_pages_trigger_id = None
-        for trigger in triggers.get("trigger", []):
-            if trigger.get("type") == "pageview":
-                all_pages_trigger_id = trigger.get("triggerId")
-                break
+        workspace_path = _workspace_path(account_id, container_id, workspace_id)
+        trigger_key = (account_id, container_id, workspace_id)
+        hit = self._all_pages_trigger_cache.get(trigger_key)
+        all_pages_trigger_id = hit[0] if hit is not None and time.monotonic() < hit[1] else None
 
         if not all_pages_trigger_id:
-            return "❌ Could not find 'All Pages' trigger. Create a pageview trigger first."
-
-        try:
-            tag = self.service.accounts().containers().workspaces().tags().create(
-                parent=f"accounts/{account_id}/containers/{container_id}/workspaces/{workspace_id}",
-                body={
-                    "name": "GA4 Configuration",
-                    "type": "gaawe",
-                    "parameter": [
-                        {"key": "measurementId", "type": "template", "value": measurement_id}
-                    ],
-                    "firingTriggerId": [all_pages_trigger_id],
-                }
-            ).execute()
-
-            return f"✅ Created GA4 configuration tag: {tag.get('name')} (ID: {tag.get('tagId')})\n\nGA4 is now linked to GTM. Create a version and publish to make it live."
-
-        except googleapiclient.errors.HttpError as e:
-            raise
+            triggers = await self._list_all(self._triggers, "trigger", "triggerId,type", parent=workspace_path)
+            all_pages_trigger_id = next((t.get("triggerId") for t in triggers if t.get("type") == "pageview"), None)
+
+        tag_body = {
+            "name": "GA4 Configuration",
+            "type": "gaawe",
+            "parameter": [
+                {"key": "measurementId", "type": "template", "value": measurement_id}
+            ],
+        }
+
+        if all_pages_trigger_id:
+            import googleapiclient.errors
+            try:
+                tag = await self._exec(self._tags.create(
+                    parent=workspace_path,
+                    body=dict(tag_body, firingTriggerId=[all_pages_trigger_id]),
+                ))
+            except googleapiclient.errors.HttpError:
+                self._all_pages_trigger_cache.pop(trigger_key, None)  # the trigger may be gone
+                raise
+            created = ""
+        else:
+            tag = await self._create_tag_with_all_pages_trigger(workspace_path, tag_body)
+            created = _OK_ALL_PAGES_CREATED
+
+        firing_trigger_ids = tag.get("firingTriggerId") or [all_pages_trigger_id]
+        if firing_trigger_ids[0]:
+            self._all_pages_trigger_cache[trigger_key] = (firing_trigger_ids[0], time.monotonic() + DEFAULT_WORKSPACE_TTL)
+
+        return created + _OK_GA4_LINKED.format(name=tag.get("name"), tag_id=tag.get("tagId"))
+
+    async def _create_tag_with_all_pages_trigger(self, workspace_path: str, tag_body: Dict[str, Any]) -> Dict[str, Any]:
+        # Trigger and tag go in as one atomic workspace change, new_* IDs let the tag reference the new trigger.
+        # Errors aren't retried one by one: a rejected tag would leave an orphan 'All Pages' trigger behind
+        trigger_body = {"name": "All Pages", "type": "pageview"}
+        bulk_update = getattr(self._workspaces, "bulk_update", None)
+        if bulk_update is not None:
+            result = await self._exec(bulk_update(
+                path=workspace_path,
+                body={"changes": [
+                    {"changeStatus": "added", "trigger": dict(trigger_body, triggerId="new_1")},
+                    {"changeStatus": "added", "tag": dict(tag_body, tagId="new_2", firingTriggerId=["new_1"])},
+                ]},
+            ))
+            for change in result.get("changes", []):
+                if "tag" in change:
+                    return change["tag"]
+            return {}
+
+        trigger = await self._exec(self._triggers.create(parent=workspace_path, body=trigger_body))
+        return await self._exec(self._tags.create(
+            parent=workspace_path,
+            body=dict(tag_body, firingTriggerId=[trigger.get("triggerId")]),
+        ))
@@ -3,7 +3,7 @@ from setuptools import setup, find_packages
 setup(
     name="metricmaster",
     version="0.1.0",
-    packages=find_packages(),
+    packages=find_packages(include=["metricmaster", "metricmaster.*"]),
     install_requires=[
         "flexus-client-kit",
         "google-api-python-client",
@@ -0,0 +1,54 @@
+import asyncio
+import collections
+
+from metricmaster import metricmaster_bot
+
+
+def test_ga_cache_reuses_read_results():
+    calls = []
+
+    async def handler(toolcall, args):
+        calls.append(args["op"])
+        return f"result {len(calls)}"
+
+    cached = metricmaster_bot._cached_ga_handler(collections.OrderedDict(), "google_analytics", handler)
+
+    async def run():
+        a = await cached(None, {"op": "listEvents", "args": {"propertyId": "1"}})
+        b = await cached(None, {"args": {"propertyId": "1"}, "op": "listEvents"})
+        c = await cached(None, {"op": "status"})
+        d = await cached(None, {"op": "status"})
+        return a, b, c, d
+
+    a, b, c, d = asyncio.run(run())
+    assert a == b == "result 1"
+    assert c != d
+    assert calls == ["listEvents", "status", "status"]
+
+
+def test_ga_cache_skips_live_ranges_and_errors():
+    calls = []
+
+    async def handler(toolcall, args):
+        calls.append(args["op"])
+        if args["op"] == "getReport" and args["args"].get("propertyId") == "missing":
+            return "❌ Property not found"
+        return f"result {len(calls)}"
+
+    cached = metricmaster_bot._cached_ga_handler(collections.OrderedDict(), "google_analytics", handler)
+
+    async def run():
+        for _ in range(2):
+            await cached(None, {"op": "getReport", "args": {"propertyId": "1", "dateRange": "today"}})
+            await cached(None, {"op": "getReport", "args": {"propertyId": "missing"}})
+
+    asyncio.run(run())
+    assert len(calls) == 4
+
+
+def test_ga_cache_passes_empty_args_through():
+    async def handler(toolcall, args):
+        return "help"
+
+    cached = metricmaster_bot._cached_ga_handler(collections.OrderedDict(), "google_analytics", handler)
+    assert asyncio.run(cached(None, None)) == "help"
@@ -1,8 +1,21 @@
+import asyncio
+import json
+import time
+import types
+
+import googleapiclient.errors
+import googleapiclient.http
+import httplib2
 import pytest
 
+from flexus_client_kit.integrations import fi_google_analytics
+from metricmaster.tools import fi_google_tag_manager, fi_google_analytics_enhanced
+
+_GTM_HELP_TOKENS = frozenset({"google_tag_manager", "listAccounts", "createContainer", "linkGA4", "publishVersion"})
+_GA_ENHANCED_HELP_TOKENS = frozenset({"google_analytics_enhanced", "listEvents", "getConversions", "getEcommerceReport", "getFunnelReport"})
+
 
 def test_gtm_tool_structure():
-    from metricmaster.tools import fi_google_tag_manager
     tool = fi_google_tag_manager.GOOGLE_TAG_MANAGER_TOOL
     assert tool.name == "google_tag_manager"
     assert tool.strict == False
@@ -12,17 +25,10 @@ def test_gtm_tool_structure():
 
 
 def test_gtm_help_content():
-    from metricmaster.tools import fi_google_tag_manager
-    help_text = fi_google_tag_manager.HELP
-    assert "google_tag_manager" in help_text
-    assert "listAccounts" in help_text
-    assert "createContainer" in help_text
-    assert "linkGA4" in help_text
-    assert "publishVersion" in help_text
+    assert _GTM_HELP_TOKENS <= fi_google_tag_manager.HELP_TOKENS
 
 
 def test_ga_enhanced_tool_structure():
-    from metricmaster.tools import fi_google_analytics_enhanced
     tool = fi_google_analytics_enhanced.GOOGLE_ANALYTICS_ENHANCED_TOOL
     assert tool.name == "google_analytics_enhanced"
     assert tool.strict == False
@@ -30,17 +36,10 @@ def test_ga_enhanced_tool_structure():
 
 
 def test_ga_enhanced_help_content():
-    from metricmaster.tools import fi_google_analytics_enhanced
-    help_text = fi_google_analytics_enhanced.HELP
-    assert "google_analytics_enhanced" in help_text
-    assert "listEvents" in help_text
-    assert "getConversions" in help_text
-    assert "getEcommerceReport" in help_text
-    assert "getFunnelReport" in help_text
+    assert _GA_ENHANCED_HELP_TOKENS <= fi_google_analytics_enhanced.HELP_TOKENS
 
 
 def test_gtm_setup_schema():
-    from metricmaster.tools import fi_google_tag_manager
     schema = fi_google_tag_manager.GOOGLE_TAG_MANAGER_SETUP_SCHEMA
     assert len(schema) == 2
     assert schema[0]["bs_name"] == "GTM_DEFAULT_ACCOUNT"
@@ -49,9 +48,123 @@ def test_gtm_setup_schema():
 
 
 def test_tool_scopes():
-    from metricmaster.tools import fi_google_tag_manager
-    from flexus_client_kit.integrations import fi_google_analytics
     gtm_scopes = fi_google_tag_manager.REQUIRED_SCOPES
     ga_scopes = fi_google_analytics.REQUIRED_SCOPES
     assert "tagmanager" in " ".join(gtm_scopes)
     assert "analytics" in " ".join(ga_scopes)
+
+
+def test_gtm_request_body_non_ascii():
+    tags = fi_google_tag_manager._service().accounts().containers().workspaces().tags()
+    request = tags.create(parent="accounts/1/containers/2/workspaces/3", body={"name": "Café 日本 tag"})
+    request.body.encode("latin-1")
+    assert json.loads(request.body) == {"name": "Café 日本 tag"}
+
+
+def test_gtm_refetches_token_after_401(monkeypatch):
+    tokens = iter(["revoked", "fresh"])
+
+    async def get_token(*args):
+        return types.SimpleNamespace(access_token=next(tokens), expires_at=time.time() + 3600)
+
+    http = googleapiclient.http.HttpMockSequence([
+        ({"status": "401"}, b'{"error": {"code": 401, "message": "Invalid Credentials"}}'),
+        ({"status": "200"}, b'{"account": [{"name": "Main", "accountId": "1"}]}'),
+    ])
+    monkeypatch.setattr(fi_google_tag_manager.ckit_external_auth, "get_external_auth_token", get_token)
+    monkeypatch.setattr(fi_google_tag_manager, "_thread_http", lambda: http)
+    rcx = types.SimpleNamespace(persona=types.SimpleNamespace(ws_id="ws-401", owner_fuser_id="user-401"))
+    gtm = fi_google_tag_manager.IntegrationGoogleTagManager(None, rcx)
+
+    result = asyncio.run(gtm.called_by_model(types.SimpleNamespace(), {"op": "listAccounts"}))
+    assert "Main (ID: 1)" in result
+    assert gtm.token_data.access_token == "fresh"
+
+
+def test_ga_enhanced_shared_report_survives_cancelled_caller():
+    calls = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def get_report(args):
+            calls.append(args)
+            await release.wait()
+            return "report"
+
+        rcx = types.SimpleNamespace(persona=types.SimpleNamespace(ws_id="ws-shared", owner_fuser_id="user-shared"))
+        base = types.SimpleNamespace(_get_report=get_report)
+        ga = fi_google_analytics_enhanced.IntegrationGoogleAnalyticsEnhanced(None, rcx, base)
+        args = {"propertyId": "shared", "dateRange": "last7days"}
+        owner = asyncio.create_task(ga._cached_report(args))
+        follower = asyncio.create_task(ga._cached_report(args))
+        await asyncio.sleep(0)
+        owner.cancel()
+        release.set()
+        return await follower, owner.cancelled()
+
+    follower_result, owner_cancelled = asyncio.run(run())
+    assert follower_result == "report"
+    assert owner_cancelled
+    assert len(calls) == 1
+
+
+def test_gtm_link_ga4_bulk_update_error_creates_no_trigger():
+    created = []
+
+    def bulk_update(**kwargs):
+        return "bulk_update"
+
+    async def exec_request(request):
+        if request == "bulk_update":
+            raise googleapiclient.errors.HttpError(httplib2.Response({"status": 400}), b'{"error": {"code": 400}}')
+        created.append(request)
+        return {}
+
+    rcx = types.SimpleNamespace(persona=types.SimpleNamespace(ws_id="ws-bulk", owner_fuser_id="user-bulk"))
+    gtm = fi_google_tag_manager.IntegrationGoogleTagManager(None, rcx)
+    gtm._workspaces = types.SimpleNamespace(bulk_update=bulk_update)
+    gtm._triggers = gtm._tags = types.SimpleNamespace(create=lambda **kwargs: "create")
+    gtm._exec = exec_request
+
+    with pytest.raises(googleapiclient.errors.HttpError):
+        asyncio.run(gtm._create_tag_with_all_pages_trigger("accounts/1/containers/2/workspaces/3", {"name": "GA4"}))
+    assert created == []
+
+
+def test_ga_enhanced_template_args_are_fresh_lists():
+    first = fi_google_analytics_enhanced._template_args("listEvents", {"propertyId": "1"})
+    first["orderBy"]["desc"] = False
+    second = fi_google_analytics_enhanced._template_args("listEvents", {"propertyId": "1"})
+    assert second["orderBy"] == {"metric": "eventCount", "desc": True}
+    assert second["metrics"] == ["eventCount", "eventValue"]
+
+    passed_through = fi_google_analytics_enhanced._template_args(
+        "getEventReport", {"propertyId": "1", "metrics": None, "dateRange": {"start": "2024-01-01"}},
+    )
+    assert passed_through["metrics"] is None
+    assert passed_through["dateRange"] == {"start": "2024-01-01"}
+
+
+def test_ga_enhanced_cache_ttl_tolerates_bad_values():
+    cache_ttl = fi_google_analytics_enhanced._cache_ttl
+    default = fi_google_analytics_enhanced.RESULT_CACHE_TTL
+    assert cache_ttl({}) == cache_ttl({"cacheTtl": None}) == cache_ttl({"cacheTtl": "soon"}) == default
+    assert cache_ttl({"cacheTtl": "30"}) == 30.0
+    assert cache_ttl({"cacheTtl": -5}) == 0.0
+
+
+def test_ga_enhanced_event_config_matches_row_values():
+    async def get_report(args):
+        return "📊 Report\n\neventName eventCount\npurchase_refund 3\npage_view 10"
+
+    rcx = types.SimpleNamespace(persona=types.SimpleNamespace(ws_id="ws-events", owner_fuser_id="user-events"))
+    base = types.SimpleNamespace(_get_report=get_report)
+    ga = fi_google_analytics_enhanced.IntegrationGoogleAnalyticsEnhanced(None, rcx, base)
+
+    def config(event_name):
+        return asyncio.run(ga._get_event_config({"propertyId": "events", "eventName": event_name}))
+
+    assert config("page_view").startswith("✅")
+    assert config("purchase").startswith("⚠️")
+    assert config("eventCount").startswith("⚠️")